@@ -0,0 +1,62 @@
+"""Latency benchmark for the single block integer API (Cipher.encrypt_block / decrypt_block)
+
+Measures the latency of individual calls and compares the 50th and 99th percentiles to the targets
+below. Exits with a non-zero status if a target is missed. The targets assume the Numba backend,
+without Numba the compiled key fallback is several times slower.
+
+Usage:
+    python benchmark.py [iterations]
+
+"""
+import sys
+import time
+
+import des
+
+P50_TARGET_US = 5
+P99_TARGET_US = 10
+
+KEY = b'descrypt'
+WARMUP = 1000
+
+
+def _percentile(sorted_samples, p):
+    return sorted_samples[min(int(len(sorted_samples) * p / 100), len(sorted_samples) - 1)]
+
+
+def measure(func, iterations):
+    """Calls func once per iteration and returns the latencies of the calls in microseconds, sorted"""
+    clock = time.perf_counter_ns
+    for block in range(WARMUP):
+        func(block)
+
+    samples = []
+    for block in range(iterations):
+        start = clock()
+        func(block)
+        samples.append((clock() - start) / 1000)
+
+    samples.sort()
+    return samples
+
+
+def main(iterations=100000):
+    cipher = des.Cipher(KEY, des.ECB)
+    backend = 'numba' if des.HAS_NUMBA else 'compiled key (numba not installed)'
+    print('backend: {}, iterations: {}'.format(backend, iterations))
+
+    ok = True
+    for name, func in [('encrypt_block', cipher.encrypt_block), ('decrypt_block', cipher.decrypt_block)]:
+        samples = measure(func, iterations)
+        p50, p99 = _percentile(samples, 50), _percentile(samples, 99)
+        passed = p50 <= P50_TARGET_US and p99 <= P99_TARGET_US
+        ok = ok and passed
+
+        print('{:<14} p50 {:7.2f} us (target {}) p99 {:7.2f} us (target {})  {}'.format(
+            name, p50, P50_TARGET_US, p99, P99_TARGET_US, 'ok' if passed else 'FAILED'))
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:2])))
@@ -1,7 +1,26 @@
+import functools
+import hashlib
+import hmac
+import lzma
+import operator
+import os
+import sys
+import threading
 import warnings
+import zlib
+from collections import OrderedDict, namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
 import numpy as np
 from bitstring import Bits
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+
 
 def _byte_array_to_bit_list(arr):
     """Converts a byte array into a list of the corresponding bits
@@ -90,36 +109,13 @@ def _KS(key):
          ndarray: An array of shape (16, 48) where row i is the i:th key
 
     """
-    left_shifts = [1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1]
-    pc1 = np.array([
-        57, 49, 41, 33, 25, 17, 9,
-        1, 58, 50, 42, 34, 26, 18,
-        10, 2, 59, 51, 43, 35, 27,
-        19, 11, 3, 60, 52, 44, 36,
-
-        63, 55, 47, 39, 31, 23, 15,
-        7, 62, 54, 46, 38, 30, 22,
-        14, 6, 61, 53, 45, 37, 29,
-        21, 13, 5, 28, 20, 12, 4
-    ])
-    pc2 = np.array([
-        14, 17, 11, 24, 1, 5,
-        3, 28, 15, 6, 21, 10,
-        23, 19, 12, 4, 26, 8,
-        16, 7, 27, 20, 13, 2,
-        41, 52, 31, 37, 47, 55,
-        30, 40, 51, 45, 33, 48,
-        44, 49, 39, 56, 34, 53,
-        46, 42, 50, 36, 29, 32
-    ])
-
-    C, D = np.split(_perm(key, pc1), 2)
+    C, D = np.split(_perm(key, __pc1), 2)
 
     keys = np.empty(16, object)
     for i in range(16):
-        C = np.roll(C, -left_shifts[i])
-        D = np.roll(D, -left_shifts[i])
-        keys[i] = _perm(np.concatenate((C, D)), pc2)
+        C = np.roll(C, -__left_shifts[i])
+        D = np.roll(D, -__left_shifts[i])
+        keys[i] = _perm(np.concatenate((C, D)), __pc2)
 
     return keys
 
@@ -448,9 +444,9 @@ def __validate_iv(mode, iv):
         iv (bytes): The initialization vector to validate.
 
     """
-    if mode == CBC:
+    if mode in (CBC, CBC_CTS):
         if not iv:
-            raise TypeError('Initialization vector must be provided if mode is CBC')
+            raise TypeError('Initialization vector must be provided if mode is {}'.format(mode))
 
         else:
             __make_sure_bytes(iv)
@@ -463,6 +459,47 @@ def __validate_iv(mode, iv):
         The iv is ignored but this might indicate an error in your program')
 
 
+def _validate(mode, iv, key=None, block=None):
+    """Validates the mode and initialization vector, and the key and block if they are given
+
+    The classes call this directly: they receive the key up front (or already hold a key schedule)
+    and the block only later, so either can be left out.
+
+    Args:
+        mode (str): The mode to validate.
+        iv (bytes): The initialization vector to validate
+        key (bytes): The key to validate, defaults to None (not checked).
+        block (bytes): The input string to validate, defaults to None (not checked).
+
+    """
+    if block is not None:
+        __make_sure_bytes(block)
+    if key is not None:
+        __make_sure_bytes(key)
+        __enforce_key_length(key)
+    __validate_iv(mode, iv)
+
+
+def _validate_int_block(block):
+    """Validates a block given as an integer, for the single block methods
+
+    Args:
+        block (int): The block to validate.
+
+    Returns:
+        int: The block as a Python int, e.g. if it was a NumPy integer.
+
+    Raises:
+        TypeError: If the block is not an integer (a float would otherwise be truncated by NumPy).
+        ValueError: If the block is not in the range 0 <= block < 2 ** 64.
+
+    """
+    block = operator.index(block)
+    if not 0 <= block < 1 << 64:
+        raise ValueError('Block must be in the range 0 <= block < 2 ** 64, got {}'.format(block))
+    return block
+
+
 def __validate_input(block, key, mode, iv):
     """Validates the input parameters
 
@@ -476,10 +513,7 @@ def __validate_input(block, key, mode, iv):
         iv (bytes): The initialization vector to validate
 
     """
-    __make_sure_bytes(block)
-    __make_sure_bytes(key)
-    __enforce_key_length(key)
-    __validate_iv(mode, iv)
+    _validate(mode, iv, key=key, block=block)
 
 
 __ip = np.array([
@@ -504,31 +538,162 @@ __ip_inv = np.array([
     33, 1, 41, 9, 49, 17, 57, 25
 ])
 
+__left_shifts = np.array([1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1])
+
+__pc1 = np.array([
+    57, 49, 41, 33, 25, 17, 9,
+    1, 58, 50, 42, 34, 26, 18,
+    10, 2, 59, 51, 43, 35, 27,
+    19, 11, 3, 60, 52, 44, 36,
+
+    63, 55, 47, 39, 31, 23, 15,
+    7, 62, 54, 46, 38, 30, 22,
+    14, 6, 61, 53, 45, 37, 29,
+    21, 13, 5, 28, 20, 12, 4
+])
+
+__pc2 = np.array([
+    14, 17, 11, 24, 1, 5,
+    3, 28, 15, 6, 21, 10,
+    23, 19, 12, 4, 26, 8,
+    16, 7, 27, 20, 13, 2,
+    41, 52, 31, 37, 47, 55,
+    30, 40, 51, 45, 33, 48,
+    44, 49, 39, 56, 34, 53,
+    46, 42, 50, 36, 29, 32
+])
+
 CBC = 'CBC'
 ECB = 'ECB'
+CBC_CTS = 'CBC-CTS'
 
+ZLIB = 'zlib'
+LZMA = 'lzma'
 
-def encrypt(block, key, mode=CBC, iv=None):
-    """Encrypts the provided block using the provided key
+MAX_DECOMPRESSED_SIZE = 64 * 2 ** 20
+
+__compression_headers = {None: 0, ZLIB: 1, LZMA: 2}
 
-    Accepts the block to encrypt as well as the key to use. The key MUST be exactly 8 bytes long and
-    both the key and the block have to be of type bytes. Will not do a parity bit check of the key.
-    If the size of block is not a multiple of 8, it will be padded using the PKCS5 method.
+
+def __steal_ciphertext(encrypt_cbc, block):
+    """Encrypts the block with CBC and ciphertext stealing (CBC-CS3) so that no padding is needed
+
+    The last, possibly partial, block is padded with zeros and the whole block is encrypted with
+    CBC. The last two ciphertext blocks are then swapped and the one that ends up last is truncated
+    to the length of the partial block, so the output is exactly as long as the input.
 
     Args:
-        block (bytes): The input string to encrypt.
-        key (bytes): The key to use for encryption.
-        mode (str): One of CBC or ECB, defaults to CBC.
-        iv (bytes): The initialization vector to use for CBC mode, should probably not be provided in ECB mode.
+        encrypt_cbc (callable): Encrypts a multiple of 8 bytes with CBC, without padding.
+        block (bytes): The input string to encrypt, at least 8 bytes long.
 
     Returns:
-        bytes: The block encrypted with the provided key.
+        bytes: The encrypted block, of the same length as block.
 
     """
-    __validate_input(block, key, mode, iv)
+    if len(block) < 8:
+        raise ValueError('Input must be at least 8 bytes long in {} mode, got {}'.format(CBC_CTS, len(block)))
+
+    d = len(block) % 8 or 8
+    encrypted = encrypt_cbc(block + bytes(8 - d))
+    if len(encrypted) == 8:
+        return encrypted
+
+    return encrypted[:-16] + encrypted[-8:] + encrypted[-16:-16 + d]
+
+
+def __unsteal_ciphertext(decrypt_cbc, decrypt_block, block):
+    """Inverse of __steal_ciphertext
+
+    Args:
+        decrypt_cbc (callable): Decrypts a multiple of 8 bytes with CBC, without unpadding.
+        decrypt_block (callable): Decrypts a single 8 byte block without any chaining.
+        block (bytes): The input string to decrypt, at least 8 bytes long.
+
+    Returns:
+        bytes: The decrypted block, of the same length as block.
+
+    """
+    if len(block) < 8:
+        raise ValueError('Input must be at least 8 bytes long in {} mode, got {}'.format(CBC_CTS, len(block)))
+
+    d = len(block) % 8 or 8
+    if len(block) == 8:
+        return decrypt_cbc(block)
+
+    # Decrypting the second to last block gives the last plaintext block (zero padded) XOR:ed with
+    # the full second to last ciphertext block, whose tail is what was stolen
+    last = decrypt_block(block[-8 - d:-d])
+    stolen = block[-d:] + last[d:]
+
+    return decrypt_cbc(block[:-8 - d] + stolen) + bytes(a ^ b for a, b in zip(last[:d], block[-d:]))
+
+
+def __split_blocks(block):
+    """Converts the bytes into a list of 64 bit blocks
+
+    Args:
+        block (bytes): The bytes to split, a multiple of 8 bytes long.
 
-    key = _byte_array_to_bit_list(key)
-    key_n = _KS(key)
+    Returns:
+        list: n ndarrays of 64 bits each.
+
+    """
+    bits = _byte_array_to_bit_list(block)
+    return np.split(bits, int(len(bits) / 64))
+
+
+def __encrypt_cts(key_n, block, iv):
+    """Encrypts the provided block using the provided keys using CBC mode with ciphertext stealing
+
+    Args:
+        key_n (ndarray): List of shape (16, 48) containing the different keys to use for each round
+        block (bytes): The input string to encrypt, at least 8 bytes long.
+        iv (bytes): The initialization vector.
+
+    Returns:
+        bytes: The encrypted block, of the same length as block.
+
+    """
+    iv = _byte_array_to_bit_list(iv)
+    return __steal_ciphertext(
+        lambda data: _bit_list_to_byte_array(np.concatenate(__encrypt_cbc(key_n, __split_blocks(data), iv))),
+        block)
+
+
+def __decrypt_cts(key_n, block, iv):
+    """Decrypts data that was previously encrypted using CBC mode with ciphertext stealing
+
+    Args:
+        key_n (ndarray): List of shape (16, 48) containing the keys in decryption (reversed) order
+        block (bytes): The input string to decrypt, at least 8 bytes long.
+        iv (bytes): The initialization vector.
+
+    Returns:
+        bytes: The decrypted block, of the same length as block.
+
+    """
+    iv = _byte_array_to_bit_list(iv)
+    return __unsteal_ciphertext(
+        lambda data: _bit_list_to_byte_array(np.concatenate(__decrypt_cbc(key_n, __split_blocks(data), iv))),
+        lambda data: _bit_list_to_byte_array(_encrypt_block(key_n, _byte_array_to_bit_list(data))),
+        block)
+
+
+def _encrypt(key_n, block, mode, iv):
+    """Pads and encrypts the already validated block using the provided sub-keys
+
+    Args:
+        key_n (ndarray): List of shape (16, 48) containing the different keys to use for each round
+        block (bytes): The input string to encrypt.
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector to use for CBC mode.
+
+    Returns:
+        bytes: The encrypted block.
+
+    """
+    if mode == CBC_CTS:
+        return __encrypt_cts(key_n, block, iv)
 
     bits = _byte_array_to_bit_list(_pad(block))
     blocks = np.split(bits, int(len(bits) / 64))
@@ -538,19 +703,21 @@ def encrypt(block, key, mode=CBC, iv=None):
     return _bit_list_to_byte_array(np.concatenate(encrypted_blocks))
 
 
-def decrypt(block, key, mode=CBC, iv=None):
-    """Decrypts the provided block that were previously encrypted with the provided key
+def _decrypt(key_n, block, mode, iv):
+    """Decrypts and unpads the already validated block using the provided sub-keys
 
     Args:
+        key_n (ndarray): List of shape (16, 48) containing the keys in decryption (reversed) order
         block (bytes): The input string to decrypt.
-        key (bytes): The key to use for decryption.
-        mode (str): One of CBC or ECB, defaults to CBC.
-        iv (bytes): The initialization vector used for CBC mode, should probably not be provided in ECB mode.
-    """
-    __validate_input(block, key, mode, iv)
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector used for CBC mode.
 
-    key = _byte_array_to_bit_list(key)
-    key_n = list(reversed(_KS(key)))
+    Returns:
+        bytes: The decrypted block.
+
+    """
+    if mode == CBC_CTS:
+        return __decrypt_cts(key_n, block, iv)
 
     bits = _byte_array_to_bit_list(block)
     blocks = np.split(bits, int(len(bits) / 64))
@@ -564,3 +731,1613 @@ def decrypt(block, key, mode=CBC, iv=None):
 
     decrypted = _bit_list_to_byte_array(np.concatenate(decrypted_blocks))
     return __unpad(decrypted)
+
+
+def _compress(block, compression, level, min_size):
+    """Compresses the block and prepends a one byte header that tells _decompress what was done
+
+    The block is stored as is (with the header) if it is shorter than min_size or if compressing
+    it would not save at least one 8 byte block of ciphertext.
+
+    Args:
+        block (bytes): The block to compress.
+        compression (str): One of ZLIB or LZMA.
+        level (int): The zlib level or lzma preset, None for the library default.
+        min_size (int): Blocks shorter than this are never compressed.
+
+    Returns:
+        bytes: The header followed by the (possibly) compressed block.
+
+    """
+    if compression not in (ZLIB, LZMA):
+        raise ValueError('Compression must be one of {} or {}, got {}'.format(ZLIB, LZMA, compression))
+
+    if len(block) >= min_size:
+        if compression == ZLIB:
+            compressed = zlib.compress(block, -1 if level is None else level)
+        else:
+            compressed = lzma.compress(block, preset=level)
+
+        if (len(compressed) + 1) // 8 < (len(block) + 1) // 8:
+            return bytes([__compression_headers[compression]]) + compressed
+
+    return bytes([__compression_headers[None]]) + block
+
+
+def _decompress(block, max_size):
+    """Inverse of _compress, reads the header and decompresses the rest of the block if needed
+
+    Decompression stops after max_size bytes, so that decrypting untrusted input cannot produce
+    arbitrarily large output.
+
+    Args:
+        block (bytes): The header followed by the (possibly) compressed block.
+        max_size (int): Maximum size of the decompressed block.
+
+    Returns:
+        bytes: The original block.
+
+    Raises:
+        ValueError: If the header is missing or unknown, the compressed data is truncated or it
+            decompresses to more than max_size bytes.
+
+    """
+    if not block:
+        raise ValueError('Missing compression header')
+
+    header, block = block[0], block[1:]
+
+    if header == __compression_headers[None]:
+        return block
+
+    if header == __compression_headers[ZLIB]:
+        decompressor = zlib.decompressobj()
+    elif header == __compression_headers[LZMA]:
+        decompressor = lzma.LZMADecompressor()
+    else:
+        raise ValueError('Unknown compression header {}'.format(header))
+
+    # One byte more than allowed, so that data of exactly max_size bytes can reach the end of stream
+    decompressed = decompressor.decompress(block, max_size + 1)
+
+    if len(decompressed) > max_size:
+        raise ValueError('Decompressed data exceeds {} bytes'.format(max_size))
+    if not decompressor.eof:
+        raise ValueError('Compressed data is truncated')
+
+    return decompressed
+
+
+def __int_encrypt_cbc(crypt, block, iv):
+    """Encrypts the block with CBC mode, one 64 bit integer at a time, without padding
+
+    Args:
+        crypt (callable): Encrypts a single block given as an integer.
+        block (bytes): The input string to encrypt, a multiple of 8 bytes long.
+        iv (bytes): The initialization vector.
+
+    Returns:
+        bytes: The encrypted block.
+
+    """
+    encrypted = []
+    previous = int.from_bytes(iv, byteorder='big')
+    for i in range(0, len(block), 8):
+        previous = crypt(int.from_bytes(block[i:i + 8], byteorder='big') ^ previous)
+        encrypted.append(previous.to_bytes(8, byteorder='big'))
+    return b''.join(encrypted)
+
+
+def __int_decrypt_cbc(crypt, block, iv):
+    """Decrypts the block with CBC mode, one 64 bit integer at a time, without unpadding
+
+    Args:
+        crypt (callable): Decrypts a single block given as an integer.
+        block (bytes): The input string to decrypt, a multiple of 8 bytes long.
+        iv (bytes): The initialization vector.
+
+    Returns:
+        bytes: The decrypted block.
+
+    """
+    decrypted = []
+    previous = int.from_bytes(iv, byteorder='big')
+    for i in range(0, len(block), 8):
+        current = int.from_bytes(block[i:i + 8], byteorder='big')
+        decrypted.append((crypt(current) ^ previous).to_bytes(8, byteorder='big'))
+        previous = current
+    return b''.join(decrypted)
+
+
+def __int_ecb(crypt, block):
+    """Encrypts or decrypts the block with ECB mode, one 64 bit integer at a time, without padding
+
+    Args:
+        crypt (callable): Encrypts or decrypts a single block given as an integer.
+        block (bytes): The input string, a multiple of 8 bytes long.
+
+    Returns:
+        bytes: The encrypted or decrypted block.
+
+    """
+    return b''.join(crypt(int.from_bytes(block[i:i + 8], byteorder='big')).to_bytes(8, byteorder='big')
+                    for i in range(0, len(block), 8))
+
+
+def _int_encrypt(crypt, block, mode, iv):
+    """Pads and encrypts the already validated block, one 64 bit integer at a time
+
+    Args:
+        crypt (callable): Encrypts a single block given as an integer.
+        block (bytes): The input string to encrypt.
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector to use for CBC mode.
+
+    Returns:
+        bytes: The encrypted block.
+
+    """
+    if mode == CBC_CTS:
+        return __steal_ciphertext(lambda data: __int_encrypt_cbc(crypt, data, iv), block)
+
+    if mode == CBC:
+        return __int_encrypt_cbc(crypt, _pad(block), iv)
+
+    return __int_ecb(crypt, _pad(block))
+
+
+def _int_decrypt(crypt, block, mode, iv):
+    """Decrypts and unpads the already validated block, one 64 bit integer at a time
+
+    Args:
+        crypt (callable): Decrypts a single block given as an integer.
+        block (bytes): The input string to decrypt.
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector used for CBC mode.
+
+    Returns:
+        bytes: The decrypted block.
+
+    """
+    if mode == CBC_CTS:
+        return __unsteal_ciphertext(lambda data: __int_decrypt_cbc(crypt, data, iv), lambda data: __int_ecb(crypt, data),
+                                    block)
+
+    if mode == CBC:
+        return __unpad(__int_decrypt_cbc(crypt, block, iv))
+
+    return __unpad(__int_ecb(crypt, block))
+
+
+def encrypt(block, key, mode=CBC, iv=None, compression=None, level=None, min_size=64):
+    """Encrypts the provided block using the provided key
+
+    Accepts the block to encrypt as well as the key to use. The key MUST be exactly 8 bytes long and
+    both the key and the block have to be of type bytes. Will not do a parity bit check of the key.
+    If the size of block is not a multiple of 8, it will be padded using the PKCS5 method, except in
+    CBC_CTS mode which uses ciphertext stealing instead, so that the result is exactly as long as
+    block. Blocks must be at least 8 bytes long in CBC_CTS mode.
+
+    If compression is given, the block is compressed before it is encrypted and a one byte header is
+    added, so the result must be decrypted with decompress=True. Ciphertext without compression has
+    no header, so decrypt cannot tell the two apart by itself. Blocks shorter than min_size, or that
+    do not get at least 8 bytes smaller, are encrypted uncompressed (still with the header).
+
+    Args:
+        block (bytes): The input string to encrypt.
+        key (bytes): The key to use for encryption.
+        mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+        iv (bytes): The initialization vector to use for CBC mode, should probably not be provided in ECB mode.
+        compression (str): None, ZLIB or LZMA, defaults to None (no compression).
+        level (int): The zlib compression level or lzma preset, defaults to the library default.
+        min_size (int): Blocks shorter than this are not compressed, defaults to 64.
+
+    Returns:
+        bytes: The block encrypted with the provided key.
+
+    """
+    __validate_input(block, key, mode, iv)
+
+    if compression is not None:
+        block = _compress(block, compression, level, min_size)
+
+    key_n = _KS(_byte_array_to_bit_list(key))
+    return _encrypt(key_n, block, mode, iv)
+
+
+def decrypt(block, key, mode=CBC, iv=None, decompress=False, max_size=MAX_DECOMPRESSED_SIZE):
+    """Decrypts the provided block that were previously encrypted with the provided key
+
+    Args:
+        block (bytes): The input string to decrypt.
+        key (bytes): The key to use for decryption.
+        mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+        iv (bytes): The initialization vector used for CBC mode, should probably not be provided in ECB mode.
+        decompress (bool): Whether the block was encrypted with compression, defaults to False.
+        max_size (int): Maximum size of the decompressed block, defaults to MAX_DECOMPRESSED_SIZE.
+    """
+    __validate_input(block, key, mode, iv)
+
+    key_n = list(reversed(_KS(_byte_array_to_bit_list(key))))
+    decrypted = _decrypt(key_n, block, mode, iv)
+    return _decompress(decrypted, max_size) if decompress else decrypted
+
+
+def _read_exactly(fileobj, n):
+    """Reads exactly n bytes from the file object
+
+    Raw (unbuffered) file objects may return fewer bytes than asked for, so keep reading until
+    there are n bytes or the end of the file is reached.
+
+    Args:
+        fileobj: A binary file object.
+        n (int): Number of bytes to read.
+
+    Returns:
+        bytes: The n bytes read.
+
+    Raises:
+        ValueError: If the file ends before n bytes could be read.
+
+    """
+    chunks = []
+    remaining = n
+    while remaining > 0:
+        chunk = fileobj.read(remaining)
+        if not chunk:
+            raise ValueError('Ciphertext is truncated, expected {} more bytes'.format(remaining))
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b''.join(chunks)
+
+
+def _write_all(fileobj, data):
+    """Writes all of data to the file object
+
+    Raw (unbuffered) file objects may write fewer bytes than they were given, so keep writing the
+    rest until everything is written.
+
+    Args:
+        fileobj: A binary file object.
+        data (bytes): The bytes to write.
+
+    Returns:
+        int: The number of bytes written, len(data).
+
+    Raises:
+        OSError: If the file object writes nothing, e.g. because it is non-blocking and full.
+
+    """
+    view = memoryview(data)
+    while view:
+        n = fileobj.write(view)
+        if not n:
+            raise OSError('Could not write to file, {} bytes left'.format(len(view)))
+        view = view[n:]
+
+    return len(data)
+
+
+class CBCReader:
+    """Read-only, seekable file-like view of the plaintext of a CBC encrypted file
+
+    In CBC mode, plaintext block i only depends on ciphertext blocks i - 1 and i, so any byte
+    range can be recovered without decrypting the rest of the file. Reads only decrypt the blocks
+    that cover the requested range and keep the most recently used plaintext blocks in a cache.
+    The PKCS5 padding at the end of the file is hidden from the reader.
+
+    Example:
+        with open('blob.enc', 'rb') as f:
+            reader = CBCReader(f, key=b'descrypt', iv=b'+\\x8c\\x17\\xcf-\\xe0k>')
+            header = reader.pread(16, 1024)
+
+    Args:
+        fileobj: A seekable binary file object containing the ciphertext.
+        key (bytes): The key that was used for encryption.
+        iv (bytes): The initialization vector that was used for encryption.
+        cache_blocks (int): Maximum number of decrypted blocks to keep in the cache.
+
+    """
+
+    def __init__(self, fileobj, key, iv, cache_blocks=1024):
+        _validate(CBC, iv, key=key)
+
+        self._file = fileobj
+        self._key_n = list(reversed(_KS(_byte_array_to_bit_list(key))))
+        self._iv = iv
+        self._cache = OrderedDict()
+        self._cache_blocks = cache_blocks
+        self._pos = 0
+
+        self._ciphertext_size = fileobj.seek(0, 2)
+        if self._ciphertext_size == 0 or self._ciphertext_size % 8 != 0:
+            raise ValueError('Ciphertext must be a non-empty multiple of 8 bytes, got {}'
+                             .format(self._ciphertext_size))
+
+        n_blocks = self._ciphertext_size // 8
+        pad_len = self._blocks(n_blocks - 1, n_blocks - 1)[-1]
+        if not 1 <= pad_len <= 8:
+            raise ValueError('Invalid PKCS5 padding, wrong key or iv?')
+
+        self._size = self._ciphertext_size - pad_len
+
+    @property
+    def size(self):
+        """int: Length of the plaintext in bytes, excluding padding"""
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        """Changes the current position, with the same semantics as io.IOBase.seek
+
+        Args:
+            offset (int): The offset relative to whence.
+            whence (int): 0 (start), 1 (current position) or 2 (end of plaintext).
+
+        Returns:
+            int: The new absolute position.
+
+        """
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = self._size + offset
+        else:
+            raise ValueError('Invalid whence ({}, should be 0, 1 or 2)'.format(whence))
+
+        if pos < 0:
+            raise ValueError('Negative seek position {}'.format(pos))
+
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        """Reads up to size bytes from the current position and advances it
+
+        Args:
+            size (int): Number of bytes to read, a negative value reads until the end.
+
+        Returns:
+            bytes: The plaintext, shorter than size if the end of the file was reached.
+
+        """
+        data = self.pread(size, self._pos)
+        self._pos += len(data)
+        return data
+
+    def pread(self, size, offset):
+        """Reads up to size bytes starting at offset without changing the current position
+
+        Args:
+            size (int): Number of bytes to read, a negative value reads until the end.
+            offset (int): Absolute plaintext offset to start reading from.
+
+        Returns:
+            bytes: The plaintext, shorter than size if the end of the file was reached.
+
+        """
+        if offset < 0:
+            raise ValueError('Negative offset {}'.format(offset))
+
+        end = self._size if size < 0 else min(offset + size, self._size)
+        if offset >= end:
+            return b''
+
+        first = offset // 8
+        data = self._blocks(first, (end - 1) // 8)
+        return data[offset - first * 8:end - first * 8]
+
+    def _blocks(self, first, last):
+        """Returns the plaintext of blocks first through last (inclusive), padding included
+
+        Blocks that are not in the cache are decrypted from a single read of the ciphertext
+        that covers them and the block preceding the first one.
+
+        """
+        blocks = {}
+        for i in range(first, last + 1):
+            if i in self._cache:
+                self._cache.move_to_end(i)
+                blocks[i] = self._cache[i]
+
+        missing = [i for i in range(first, last + 1) if i not in blocks]
+
+        if missing:
+            start = missing[0]
+            self._file.seek(max(start - 1, 0) * 8)
+            ciphertext = _read_exactly(self._file, (missing[-1] + 1 - max(start - 1, 0)) * 8)
+            if start == 0:
+                ciphertext = self._iv + ciphertext
+
+            for i in missing:
+                offset = (i - start) * 8
+                previous = _byte_array_to_bit_list(ciphertext[offset:offset + 8])
+                block = _byte_array_to_bit_list(ciphertext[offset + 8:offset + 16])
+                block = _xor(_encrypt_block(self._key_n, block), previous)
+                blocks[i] = _bit_list_to_byte_array(block)
+                self._cache_put(i, blocks[i])
+
+        return b''.join(blocks[i] for i in range(first, last + 1))
+
+    def _cache_put(self, i, block):
+        self._cache[i] = block
+        if len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+
+
+class KeySchedule:
+    """The 16 sub-keys derived from a key, in both encryption and decryption order
+
+    A schedule serializes to a compact binary form of 200 bytes: the 16 48-bit sub-keys in
+    encryption order followed by the same sub-keys in decryption (reversed) order, each packed into
+    6 big-endian bytes, and an 8 byte checksum of those. Restoring a schedule from that form skips
+    _byte_array_to_bit_list and _KS.
+
+    Args:
+        encryption_keys (ndarray): Array of shape (16, 48) containing the sub-keys in encryption order.
+        decryption_keys (ndarray): Array of shape (16, 48) containing the sub-keys in decryption order.
+
+    """
+    SIZE = 2 * 16 * 6 + 8
+
+    def __init__(self, encryption_keys, decryption_keys):
+        self.encryption_keys = encryption_keys
+        self.decryption_keys = decryption_keys
+
+    @classmethod
+    def from_key(cls, key):
+        """Derives the schedule for the provided key
+
+        Args:
+            key (bytes): The 8 byte key.
+
+        Returns:
+            KeySchedule: The schedule for key.
+
+        """
+        _validate(ECB, None, key=key)
+        keys = np.array(list(_KS(_byte_array_to_bit_list(key))), dtype=np.uint8)
+        return cls(keys, keys[::-1])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Restores a schedule from its serialized form
+
+        Args:
+            data (bytes): A bytes-like object of at least SIZE bytes as produced by to_bytes.
+                Only the first SIZE bytes are read.
+
+        Returns:
+            KeySchedule: The restored schedule.
+
+        Raises:
+            ValueError: If data is too short or the checksum does not match, e.g. because the
+                schedule was read before it was completely written.
+
+        """
+        if len(data) < cls.SIZE:
+            raise ValueError('Expected a serialized key schedule of {} bytes, got {}'.format(cls.SIZE, len(data)))
+
+        data = bytes(data[:cls.SIZE])
+        if hashlib.sha256(data[:-8]).digest()[:8] != data[-8:]:
+            raise ValueError('Serialized key schedule is corrupt or incomplete')
+
+        packed = np.frombuffer(data, dtype=np.uint8, count=cls.SIZE - 8).reshape(2, 16, 6)
+        encryption_keys, decryption_keys = np.unpackbits(packed, axis=2)
+        return cls(encryption_keys, decryption_keys)
+
+    def to_bytes(self):
+        """Serializes the schedule
+
+        Returns:
+            bytes: The SIZE byte serialized form of the schedule.
+
+        """
+        keys = np.array([self.encryption_keys, self.decryption_keys], dtype=np.uint8)
+        packed = np.packbits(keys, axis=2).tobytes()
+        return packed + hashlib.sha256(packed).digest()[:8]
+
+    @staticmethod
+    def fingerprint(key, secret):
+        """Computes the identifier that a key schedule is stored under
+
+        The identifier is an HMAC keyed with secret, since it ends up in names that every local
+        user can list, and a plain hash of a 56 bit key would let them test guesses against it.
+
+        Args:
+            key (bytes): The 8 byte key.
+            secret (bytes): The secret of the store.
+
+        Returns:
+            str: A 16 character hexadecimal digest of the key.
+
+        """
+        return hmac.new(secret, key, hashlib.sha256).hexdigest()[:16]
+
+
+def _open_segment(name, create=False, size=0):
+    """Opens a shared memory segment without handing it to the resource tracker
+
+    By default every process that opens a segment registers it with its resource tracker, which
+    removes the segment when that process exits, even if other processes still use it. Python 3.13
+    can skip the registration with track=False, older versions have to unregister afterwards.
+
+    Args:
+        name (str): The name of the segment.
+        create (bool): Whether to create a new segment instead of attaching to an existing one.
+        size (int): Size of the segment to create.
+
+    Returns:
+        SharedMemory: The segment.
+
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if os.name == 'posix':
+            # pylint: disable=protected-access
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+# Segments this process has mapped, by name, and the ones it has unlinked since. They stay mapped
+# for the life of the process since the key schedules read from them are views into the segments.
+_shared_segments = {}
+_unlinked_segments = []
+
+
+class SharedKeyStore:
+    """Key schedules in shared memory, shared between processes on the same machine
+
+    Each schedule is kept in its own shared memory segment named after the prefix and the key
+    fingerprint, so any process that knows the key (and the prefix and secret of the store) can
+    attach to it. The segment holds
+    the sub-keys in the same layout that Cipher uses, and get returns views into it, so attaching
+    processes neither derive nor copy the sub-keys. Segments are not removed when a process exits,
+    call unlink once the schedule is no longer needed by any process.
+
+    Example:
+        # In the parent, before starting the workers
+        store = SharedKeyStore()
+        store.put(b'descrypt')
+
+        # In a worker, given store.prefix and store.secret
+        cipher = Cipher.from_schedule(SharedKeyStore(prefix, secret).get(b'descrypt'), iv=iv)
+
+    Args:
+        prefix (str): Prefix of the shared memory segment names.
+        secret (bytes): Key of the fingerprints, defaults to 16 random bytes. Pass it to the
+            workers along with the prefix, and keep it from other users.
+
+    """
+    # The fingerprint of the key, written after the sub-keys to mark the segment as ready
+    _HEADER_SIZE = 8
+    _SEGMENT_SIZE = _HEADER_SIZE + 2 * 16 * 48
+
+    def __init__(self, prefix='des_ks', secret=None):
+        self.prefix = prefix
+        self.secret = os.urandom(16) if secret is None else secret
+
+    def _name(self, key):
+        return '{}_{}'.format(self.prefix, KeySchedule.fingerprint(key, self.secret))
+
+    def put(self, key):
+        """Derives the schedule for key and stores it, unless it is already stored
+
+        A segment that exists but was never marked as ready, e.g. because the process creating it
+        died, is taken over: every writer writes the same bytes, so the schedule is written into it
+        again instead of waiting for the original writer.
+
+        Args:
+            key (bytes): The 8 byte key.
+
+        Returns:
+            KeySchedule: The schedule for key, as views into shared memory.
+
+        """
+        _validate(ECB, None, key=key)
+        name = self._name(key)
+        while True:
+            try:
+                segment = _open_segment(name, create=True, size=SharedKeyStore._SEGMENT_SIZE)
+                break
+            except FileExistsError:
+                pass
+            try:
+                segment = _open_segment(name)
+                break
+            except FileNotFoundError:
+                # Unlinked since, create it again
+                continue
+
+        if bytes(segment.buf[:SharedKeyStore._HEADER_SIZE]) != self._marker(key):
+            schedule = KeySchedule.from_key(key)
+            keys = np.array([schedule.encryption_keys, schedule.decryption_keys], dtype=np.uint8)
+            segment.buf[SharedKeyStore._HEADER_SIZE:SharedKeyStore._SEGMENT_SIZE] = keys.tobytes()
+            segment.buf[:SharedKeyStore._HEADER_SIZE] = self._marker(key)
+        elif name in _shared_segments:
+            segment.close()
+            return self._schedule(_shared_segments[name][-1])
+
+        _shared_segments.setdefault(name, []).append(segment)
+
+        return self._schedule(segment)
+
+    def get(self, key):
+        """Returns the schedule for key, as views into shared memory
+
+        Args:
+            key (bytes): The 8 byte key.
+
+        Returns:
+            KeySchedule: The stored schedule.
+
+        Raises:
+            KeyError: If no schedule is stored for key, or it is still being written.
+
+        """
+        name = self._name(key)
+        if name in _shared_segments:
+            return self._schedule(_shared_segments[name][-1])
+
+        # Only segments that are marked as ready are kept, one that is not may be replaced (unlinked
+        # and put again) by another process, so it is attached again on the next call
+        segment = self._attach(key)
+        if bytes(segment.buf[:SharedKeyStore._HEADER_SIZE]) != self._marker(key):
+            segment.close()
+            raise KeyError(KeySchedule.fingerprint(key, self.secret))
+
+        _shared_segments[name] = [segment]
+        return self._schedule(segment)
+
+    def unlink(self, key):
+        """Removes the schedule for key from shared memory
+
+        Processes that already read the schedule can keep using it.
+
+        Args:
+            key (bytes): The 8 byte key.
+
+        Raises:
+            KeyError: If no schedule is stored for key.
+
+        """
+        # Opened with tracking, since unlinking unregisters the segment from the resource tracker
+        try:
+            segment = shared_memory.SharedMemory(name=self._name(key))
+        except FileNotFoundError:
+            raise KeyError(KeySchedule.fingerprint(key, self.secret)) from None
+
+        segment.close()
+        segment.unlink()
+        _unlinked_segments.extend(_shared_segments.pop(self._name(key), []))
+
+    def __contains__(self, key):
+        try:
+            self._attach(key).close()
+        except KeyError:
+            return False
+        return True
+
+    def _marker(self, key):
+        return bytes.fromhex(KeySchedule.fingerprint(key, self.secret))
+
+    def _attach(self, key):
+        try:
+            return _open_segment(self._name(key))
+        except FileNotFoundError:
+            raise KeyError(KeySchedule.fingerprint(key, self.secret)) from None
+
+    @staticmethod
+    def _schedule(segment):
+        keys = np.ndarray((2, 16, 48), dtype=np.uint8, buffer=segment.buf, offset=SharedKeyStore._HEADER_SIZE)
+        keys.flags.writeable = False
+        return KeySchedule(keys[0], keys[1])
+
+
+class Cipher:
+    """A DES cipher bound to a key schedule, mode and initialization vector
+
+    Construct it with a key, or with from_schedule to reuse a schedule that was derived elsewhere
+    (e.g. read from a SharedKeyStore) without deriving the sub-keys again. If compression is given,
+    encrypt compresses and decrypt decompresses, see des.encrypt.
+
+    Args:
+        key (bytes): The key to use, MUST be exactly 8 bytes long.
+        mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+        iv (bytes): The initialization vector to use for CBC mode.
+        compression (str): None, ZLIB or LZMA, defaults to None (no compression).
+        level (int): The zlib compression level or lzma preset, defaults to the library default.
+        min_size (int): Blocks shorter than this are not compressed, defaults to 64.
+
+    """
+
+    def __init__(self, key, mode=CBC, iv=None, compression=None, level=None, min_size=64):
+        _validate(mode, iv, key=key)
+        self._init(KeySchedule.from_key(key), mode, iv, compression, level, min_size)
+
+    @classmethod
+    def from_schedule(cls, schedule, mode=CBC, iv=None, compression=None, level=None, min_size=64):
+        """Creates a cipher from an existing key schedule
+
+        Args:
+            schedule (KeySchedule): The key schedule to use.
+            mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+            iv (bytes): The initialization vector to use for CBC mode.
+            compression (str): None, ZLIB or LZMA, defaults to None (no compression).
+            level (int): The zlib compression level or lzma preset, defaults to the library default.
+            min_size (int): Blocks shorter than this are not compressed, defaults to 64.
+
+        Returns:
+            Cipher: The cipher.
+
+        """
+        _validate(mode, iv)
+        cipher = cls.__new__(cls)
+        cipher._init(schedule, mode, iv, compression, level, min_size)
+        return cipher
+
+    def _init(self, schedule, mode, iv, compression, level, min_size):
+        self.schedule = schedule
+        self.mode = mode
+        self.iv = iv
+        self.compression = compression
+        self.level = level
+        self.min_size = min_size
+        self._block_key = None
+
+    def encrypt(self, block):
+        """Encrypts the provided block, see des.encrypt
+
+        Args:
+            block (bytes): The input string to encrypt.
+
+        Returns:
+            bytes: The encrypted block.
+
+        """
+        if not isinstance(block, bytes):
+            raise TypeError('Argument must be of type string or bytes')
+        if self.compression is not None:
+            block = _compress(block, self.compression, self.level, self.min_size)
+        return _encrypt(self.schedule.encryption_keys, block, self.mode, self.iv)
+
+    def decrypt(self, block, max_size=MAX_DECOMPRESSED_SIZE):
+        """Decrypts the provided block, see des.decrypt
+
+        Args:
+            block (bytes): The input string to decrypt.
+            max_size (int): Maximum size of the decompressed block, if the cipher uses compression.
+
+        Returns:
+            bytes: The decrypted block.
+
+        """
+        if not isinstance(block, bytes):
+            raise TypeError('Argument must be of type string or bytes')
+        decrypted = _decrypt(self.schedule.decryption_keys, block, self.mode, self.iv)
+        return decrypted if self.compression is None else _decompress(decrypted, max_size)
+
+    def encrypt_block(self, block):
+        """Encrypts a single 64 bit block given as an integer
+
+        This is the low latency path for callers that encrypt one block at a time: there is no
+        padding and no chaining, so it is only available for ciphers in ECB mode, and no bit lists
+        are created. It runs on the Numba backend if it is installed and on a compiled key
+        otherwise, both are set up on the first call.
+
+        Example:
+            token = cipher.encrypt_block(0x0123456789abcdef)
+
+        Args:
+            block (int): The block to encrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The encrypted block.
+
+        Raises:
+            TypeError: If the block is not an integer.
+            ValueError: If the cipher is not in ECB mode or the block is out of range.
+
+        """
+        return (self._block_key or self._make_block_key()).encrypt_block(block)
+
+    def decrypt_block(self, block):
+        """Decrypts a single 64 bit block given as an integer, see encrypt_block
+
+        Args:
+            block (int): The block to decrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The decrypted block.
+
+        Raises:
+            TypeError: If the block is not an integer.
+            ValueError: If the cipher is not in ECB mode or the block is out of range.
+
+        """
+        return (self._block_key or self._make_block_key()).decrypt_block(block)
+
+    def _make_block_key(self):
+        if self.mode != ECB:
+            raise ValueError('Single block encryption requires {} mode, got {}'.format(ECB, self.mode))
+        self._block_key = (JITKey if HAS_NUMBA else CompiledKey).from_schedule(self.schedule)
+        return self._block_key
+
+
+def _subkey_ints(schedule):
+    """Returns the sub-keys of the schedule, in encryption order, as 48 bit integers"""
+    return [int.from_bytes(k.tobytes(), byteorder='big') for k in np.packbits(schedule.encryption_keys, axis=1)]
+
+
+def _byte_perm_tables(p, width=64):
+    """Builds lookup tables that apply the permutation p to a width bit integer one byte at a time
+
+    Table m maps the value of the m:th most significant input byte to the output bits it
+    contributes to, so that permuting is 8 lookups OR:ed together instead of one step per bit.
+
+    Args:
+        p (ndarray): The permutation table, 1-indexed as in the DES paper.
+        width (int): Number of bits in the input.
+
+    Returns:
+        list: width / 8 lists of 256 integers each.
+
+    """
+    tables = [[0] * 256 for _ in range(width // 8)]
+    for i, source in enumerate(p):
+        byte, bit = divmod(int(source) - 1, 8)
+        for value in range(256):
+            if value & (0x80 >> bit):
+                tables[byte][value] |= 1 << (len(p) - 1 - i)
+    return tables
+
+
+def _sp_tables():
+    """Computes the output of the S-functions followed by P as 32 bit integers
+
+    Returns:
+        list: 8 lists of 64 integers, entry [n][x] is P applied to the output of S-function n on the
+            6 bit input x with all other S-function outputs set to zero.
+
+    """
+    tables = []
+    for n in range(8):
+        table = []
+        for x in range(64):
+            L = np.zeros((8, 4), int)
+            L[n] = _S(n, np.array([(x >> (5 - i)) & 1 for i in range(6)]))
+            table.append(int(''.join(map(str, _P(L))), 2))
+        tables.append(table)
+    return tables
+
+
+_LookupTables = namedtuple('_LookupTables', ['sp', 'sp_array', 'ip', 'ip_inv'])
+
+
+@functools.lru_cache(maxsize=None)
+def _lookup_tables():
+    """Builds the key independent lookup tables of the integer implementations
+
+    The tables are built on first use and shared by CompiledKey and the Numba kernels.
+
+    Returns:
+        _LookupTables: sp holds the tables from _sp_tables as lists, sp_array the same tables as an
+            (8, 64) uint64 array for the kernels, and ip and ip_inv hold the tables from
+            _byte_perm_tables for the initial and final permutation.
+
+    """
+    sp = _sp_tables()
+    return _LookupTables(sp, np.array(sp, dtype=np.uint64), _byte_perm_tables(__ip), _byte_perm_tables(__ip_inv))
+
+
+class CompiledKey:
+    """A key specialized into per-round lookup tables for fast encryption and decryption
+
+    The sub-key XOR of each round is folded into that round's S-function and P tables, so that f
+    becomes 8 table lookups on bits of R and no key mixing happens at run time. Blocks are handled as
+    64 bit integers and never converted to bit lists. A compiled key takes a few hundred kilobytes,
+    see nbytes, so only compile keys that are used a lot. Use des.compile to get cached instances.
+
+    Args:
+        key (bytes): The key to compile, MUST be exactly 8 bytes long.
+
+    """
+
+    def __init__(self, key):
+        _validate(ECB, None, key=key)
+        self._init(KeySchedule.from_key(key))
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        """Compiles an existing key schedule
+
+        Args:
+            schedule (KeySchedule): The key schedule to compile.
+
+        Returns:
+            CompiledKey: The compiled key.
+
+        """
+        compiled = cls.__new__(cls)
+        compiled._init(schedule)
+        return compiled
+
+    def _init(self, schedule):
+        tables = _lookup_tables()
+        self._ip = tables.ip
+        self._ip_inv = tables.ip_inv
+
+        self._rounds = []
+        for k in _subkey_ints(schedule):
+            table = []
+            for n in range(8):
+                k_n = (k >> (42 - 6 * n)) & 0x3f
+                table.extend(tables.sp[n][x ^ k_n] for x in range(64))
+            self._rounds.append(table)
+        self._reversed_rounds = self._rounds[::-1]
+
+        self.nbytes = sum(sys.getsizeof(t) + sum(map(sys.getsizeof, t)) for t in self._rounds)
+
+    def encrypt(self, block, mode=CBC, iv=None, compression=None, level=None, min_size=64):
+        """Encrypts the provided block, the result is identical to des.encrypt with the same key
+
+        Args:
+            block (bytes): The input string to encrypt.
+            mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+            iv (bytes): The initialization vector to use for CBC mode.
+            compression (str): None, ZLIB or LZMA, defaults to None (no compression).
+            level (int): The zlib compression level or lzma preset, defaults to the library default.
+            min_size (int): Blocks shorter than this are not compressed, defaults to 64.
+
+        Returns:
+            bytes: The encrypted block.
+
+        """
+        _validate(mode, iv, block=block)
+        if compression is not None:
+            block = _compress(block, compression, level, min_size)
+        return _int_encrypt(self.encrypt_block, block, mode, iv)
+
+    def decrypt(self, block, mode=CBC, iv=None, decompress=False, max_size=MAX_DECOMPRESSED_SIZE):
+        """Decrypts the provided block, the result is identical to des.decrypt with the same key
+
+        Args:
+            block (bytes): The input string to decrypt.
+            mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+            iv (bytes): The initialization vector used for CBC mode.
+            decompress (bool): Whether the block was encrypted with compression, defaults to False.
+            max_size (int): Maximum size of the decompressed block, defaults to MAX_DECOMPRESSED_SIZE.
+
+        Returns:
+            bytes: The decrypted block.
+
+        """
+        _validate(mode, iv, block=block)
+        decrypted = _int_decrypt(self.decrypt_block, block, mode, iv)
+        return _decompress(decrypted, max_size) if decompress else decrypted
+
+    def encrypt_block(self, block):
+        """Encrypts a single block given as an integer, without padding or chaining
+
+        Args:
+            block (int): The block to encrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The encrypted block.
+
+        """
+        block = _validate_int_block(block)
+        return CompiledKey._crypt(block, self._rounds, self._ip, self._ip_inv)
+
+    def decrypt_block(self, block):
+        """Decrypts a single block given as an integer, see encrypt_block
+
+        Args:
+            block (int): The block to decrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The decrypted block.
+
+        """
+        block = _validate_int_block(block)
+        return CompiledKey._crypt(block, self._reversed_rounds, self._ip, self._ip_inv)
+
+    @staticmethod
+    def _crypt(block, rounds, ip, ip_inv):
+        block = (ip[0][block >> 56] | ip[1][(block >> 48) & 0xff] | ip[2][(block >> 40) & 0xff] |
+                 ip[3][(block >> 32) & 0xff] | ip[4][(block >> 24) & 0xff] | ip[5][(block >> 16) & 0xff] |
+                 ip[6][(block >> 8) & 0xff] | ip[7][block & 0xff])
+        L = block >> 32
+        R = block & 0xffffffff
+
+        for t in rounds:
+            # R with its last bit prepended and first bit appended, so each E chunk is a plain shift
+            x = ((R & 1) << 33) | (R << 1) | (R >> 31)
+            L, R = R, L ^ (t[x >> 28] | t[64 | ((x >> 24) & 0x3f)] | t[128 | ((x >> 20) & 0x3f)] |
+                           t[192 | ((x >> 16) & 0x3f)] | t[256 | ((x >> 12) & 0x3f)] |
+                           t[320 | ((x >> 8) & 0x3f)] | t[384 | ((x >> 4) & 0x3f)] | t[448 | (x & 0x3f)])
+
+        return (ip_inv[0][R >> 24] | ip_inv[1][(R >> 16) & 0xff] | ip_inv[2][(R >> 8) & 0xff] |
+                ip_inv[3][R & 0xff] | ip_inv[4][L >> 24] | ip_inv[5][(L >> 16) & 0xff] |
+                ip_inv[6][(L >> 8) & 0xff] | ip_inv[7][L & 0xff])
+
+
+class CompiledKeyCache:
+    """A bounded least recently used cache of compiled keys
+
+    Compiled keys are evicted, least recently used first, once there are more than max_keys of them
+    or they take more than max_bytes in total. The most recently used key is always kept. The cache
+    may be shared between threads.
+
+    Args:
+        max_keys (int): Maximum number of compiled keys to keep.
+        max_bytes (int): Memory budget for all compiled keys, see CompiledKey.nbytes.
+
+    """
+
+    def __init__(self, max_keys=16, max_bytes=8 * 2 ** 20):
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def get(self, key):
+        """Returns the compiled key, compiling it if it is not in the cache
+
+        Args:
+            key (bytes): The key to compile, MUST be exactly 8 bytes long.
+
+        Returns:
+            CompiledKey: The compiled key.
+
+        """
+        with self._lock:
+            compiled = self._keys.get(key)
+            if compiled is not None:
+                self._keys.move_to_end(key)
+                return compiled
+
+        # Compiling takes a while, so do it without holding the lock and keep whichever compiled key
+        # made it into the cache first if another thread compiled the same key in the meantime
+        compiled = CompiledKey(key)
+
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return self._keys[key]
+
+            self._keys[key] = compiled
+            self.nbytes += compiled.nbytes
+
+            while len(self._keys) > 1 and (len(self._keys) > self.max_keys or self.nbytes > self.max_bytes):
+                _, evicted = self._keys.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self.nbytes = 0
+
+
+_compiled_keys = CompiledKeyCache()
+
+
+def compile(key, cache=None):
+    """Compiles the key into per-round lookup tables, see CompiledKey
+
+    Example:
+        hot = des.compile(b'descrypt')
+        cipher_text = hot.encrypt(b'abcdefgh', iv=b'+\x8c\x17\xcf-\xe0k>')
+
+    Args:
+        key (bytes): The key to compile, MUST be exactly 8 bytes long.
+        cache (CompiledKeyCache): The cache to use, defaults to a module wide cache.
+
+    Returns:
+        CompiledKey: The compiled key.
+
+    """
+    # pylint: disable=redefined-builtin
+    return (_compiled_keys if cache is None else cache).get(key)
+
+
+def __int_rekey(decrypt, encrypt, block, old_mode, new_mode, old_iv, new_iv):
+    """Decrypts the block with the old key and encrypts the result with the new key, in one pass
+
+    Each 64 bit integer is decrypted and encrypted again before moving on to the next one, so the
+    plaintext is never assembled. The padding is part of the decrypted blocks and is encrypted along
+    with them, so there is no need to unpad and pad again in between.
+
+    Args:
+        decrypt (callable): Decrypts a single block given as an integer with the old key.
+        encrypt (callable): Encrypts a single block given as an integer with the new key.
+        block (bytes): The ciphertext to re-encrypt, a multiple of 8 bytes long.
+        old_mode (str): The mode the block was encrypted with, CBC_CTS is treated as CBC.
+        new_mode (str): The mode to encrypt the block with, CBC_CTS is treated as CBC.
+        old_iv (bytes): The old initialization vector, or the last old ciphertext block before these.
+        new_iv (bytes): The new initialization vector, or the last new ciphertext block before these.
+
+    Returns:
+        bytes: The re-encrypted block.
+
+    """
+    old_chained = old_mode != ECB
+    new_chained = new_mode != ECB
+    old_previous = int.from_bytes(old_iv, byteorder='big') if old_chained else 0
+    new_previous = int.from_bytes(new_iv, byteorder='big') if new_chained else 0
+
+    rekeyed = []
+    for i in range(0, len(block), 8):
+        current = int.from_bytes(block[i:i + 8], byteorder='big')
+        encrypted = encrypt(decrypt(current) ^ old_previous ^ new_previous)
+        rekeyed.append(encrypted.to_bytes(8, byteorder='big'))
+        if old_chained:
+            old_previous = current
+        if new_chained:
+            new_previous = encrypted
+    return b''.join(rekeyed)
+
+
+def __validate_rekey_input(old_key, new_key, old_mode, new_mode, old_iv, new_iv):
+    _validate(old_mode, old_iv, key=old_key)
+    _validate(new_mode, new_iv, key=new_key)
+
+
+def rekey(block, old_key, new_key, old_mode=CBC, new_mode=CBC, old_iv=None, new_iv=None):
+    """Re-encrypts data that was encrypted with old_key so that it is encrypted with new_key
+
+    The result is identical to encrypt(decrypt(block, old_key, ...), new_key, ...), but both keys
+    are compiled (see CompiledKey) and each 64 bit block is decrypted and encrypted again in a
+    single pass, and the padding is kept as is instead of being removed and added again. The mode
+    and iv may be changed at the same time. When converting from or to CBC_CTS the padding has to
+    change, so that decrypts and encrypts the whole block one after the other.
+
+    Args:
+        block (bytes): The ciphertext to re-encrypt.
+        old_key (bytes): The key that block was encrypted with.
+        new_key (bytes): The key to encrypt with.
+        old_mode (str): One of CBC, CBC_CTS or ECB, the mode block was encrypted with, defaults to CBC.
+        new_mode (str): One of CBC, CBC_CTS or ECB, the mode to encrypt with, defaults to CBC.
+        old_iv (bytes): The initialization vector block was encrypted with, for CBC mode.
+        new_iv (bytes): The initialization vector to encrypt with, for CBC mode.
+
+    Returns:
+        bytes: The block encrypted with new_key.
+
+    """
+    __make_sure_bytes(block)
+    __validate_rekey_input(old_key, new_key, old_mode, new_mode, old_iv, new_iv)
+
+    old = CompiledKey(old_key)
+    new = CompiledKey(new_key)
+
+    if CBC_CTS in (old_mode, new_mode):
+        return _int_encrypt(new.encrypt_block, _int_decrypt(old.decrypt_block, block, old_mode, old_iv), new_mode, new_iv)
+
+    if not block or len(block) % 8 != 0:
+        raise ValueError('Ciphertext must be a non-empty multiple of 8 bytes, got {}'.format(len(block)))
+
+    return __int_rekey(old.decrypt_block, new.encrypt_block, block, old_mode, new_mode, old_iv, new_iv)
+
+
+def rekey_stream(src, dst, old_key, new_key, old_mode=CBC, new_mode=CBC, old_iv=None, new_iv=None,
+                 chunk_size=64 * 1024):
+    """Re-encrypts everything read from src and writes it to dst, see rekey
+
+    Reads src chunk by chunk and carries the CBC state over from one chunk to the next, so memory
+    use does not depend on the size of the data. In CBC_CTS mode everything but the last two
+    blocks is plain CBC, so only the last 24 to 31 bytes are held back until the end of src (enough
+    for two plaintext blocks even if the old ciphertext ends with a block of padding).
+
+    Args:
+        src: A binary file object to read the ciphertext from.
+        dst: A binary file object to write the re-encrypted ciphertext to.
+        old_key (bytes): The key that the data was encrypted with.
+        new_key (bytes): The key to encrypt with.
+        old_mode (str): One of CBC, CBC_CTS or ECB, the mode the data was encrypted with, defaults to CBC.
+        new_mode (str): One of CBC, CBC_CTS or ECB, the mode to encrypt with, defaults to CBC.
+        old_iv (bytes): The initialization vector the data was encrypted with, for CBC mode.
+        new_iv (bytes): The initialization vector to encrypt with, for CBC mode.
+        chunk_size (int): Number of bytes to read at a time.
+
+    Returns:
+        int: The number of bytes written to dst.
+
+    """
+    __validate_rekey_input(old_key, new_key, old_mode, new_mode, old_iv, new_iv)
+
+    old = CompiledKey(old_key)
+    new = CompiledKey(new_key)
+
+    stealing = CBC_CTS in (old_mode, new_mode)
+    held_back = 24 if stealing else 0
+
+    written = 0
+    buffered = b''
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+
+        buffered += chunk
+        n = (len(buffered) - held_back) // 8 * 8
+        if n <= 0:
+            continue
+
+        blocks = buffered[:n]
+        buffered = buffered[n:]
+
+        rekeyed = __int_rekey(old.decrypt_block, new.encrypt_block, blocks, old_mode, new_mode, old_iv, new_iv)
+        old_iv, new_iv = blocks[-8:], rekeyed[-8:]
+
+        written += _write_all(dst, rekeyed)
+
+    if written == 0 and not buffered:
+        raise ValueError('Ciphertext must not be empty')
+
+    if stealing:
+        decrypted = _int_decrypt(old.decrypt_block, buffered, old_mode, old_iv)
+        written += _write_all(dst, _int_encrypt(new.encrypt_block, decrypted, new_mode, new_iv))
+
+    elif buffered:
+        raise ValueError('Ciphertext must be a multiple of 8 bytes, got {}'.format(written + len(buffered)))
+
+    return written
+
+
+def _jit(func):
+    """Compiles func to machine code with Numba, if it is installed
+
+    The compiled code is cached on disk next to this file, so it is only compiled once, and the
+    GIL is released while it runs, so threads can encrypt in parallel. Without Numba, func is
+    returned as is and still works, only slowly.
+
+    """
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+@_jit
+def _kernel_permute(x, table, width):
+    """Permutes the bits of the width bit integer x using the 1-indexed permutation table"""
+    out = np.uint64(0)
+    n = table.shape[0]
+    for i in range(n):
+        bit = (x >> np.uint64(width - table[i])) & np.uint64(1)
+        out |= bit << np.uint64(n - 1 - i)
+    return out
+
+
+@_jit
+def _kernel_key_schedule(key):
+    """Computes the 16 48 bit sub-keys of the 64 bit key, see _KS"""
+    mask = np.uint64(0xfffffff)
+    cd = _kernel_permute(key, __pc1, 64)
+    C = cd >> np.uint64(28)
+    D = cd & mask
+
+    keys = np.empty(16, np.uint64)
+    for i in range(16):
+        shift = np.uint64(__left_shifts[i])
+        C = ((C << shift) | (C >> (np.uint64(28) - shift))) & mask
+        D = ((D << shift) | (D >> (np.uint64(28) - shift))) & mask
+        keys[i] = _kernel_permute((C << np.uint64(28)) | D, __pc2, 56)
+
+    return keys
+
+
+@_jit
+def _kernel_crypt_block(block, keys, sp):
+    """Encrypts (or, with the keys reversed, decrypts) a 64 bit block, see _encrypt_block
+
+    sp holds the output of each S-function followed by P, as computed by _sp_tables.
+
+    """
+    block = _kernel_permute(block, __ip, 64)
+    L = block >> np.uint64(32)
+    R = block & np.uint64(0xffffffff)
+
+    for k in keys:
+        # R with its last bit prepended and first bit appended, so each E chunk is a plain shift
+        x = ((R & np.uint64(1)) << np.uint64(33)) | (R << np.uint64(1)) | (R >> np.uint64(31))
+        f = np.uint64(0)
+        for n in range(8):
+            chunk = ((x >> np.uint64(28 - 4 * n)) ^ (k >> np.uint64(42 - 6 * n))) & np.uint64(0x3f)
+            f |= sp[n, chunk]
+        L, R = R, L ^ f
+
+    return _kernel_permute((R << np.uint64(32)) | L, __ip_inv, 64)
+
+
+@_jit
+def _kernel_ecb(blocks, keys, sp):
+    """Encrypts (or, with the keys reversed, decrypts) the blocks using ECB mode
+
+    Args:
+        blocks (ndarray): The blocks as uint64.
+        keys (ndarray): The 16 sub-keys as 48 bit integers.
+        sp (ndarray): The S-function and P tables, see _lookup_tables.
+
+    Returns:
+        ndarray: The encrypted blocks.
+
+    """
+    out = np.empty_like(blocks)
+    for i in range(blocks.shape[0]):
+        out[i] = _kernel_crypt_block(blocks[i], keys, sp)
+    return out
+
+
+@_jit
+def _kernel_encrypt_cbc(blocks, keys, sp, iv):
+    """Encrypts the blocks using CBC mode, see __encrypt_cbc
+
+    Args:
+        blocks (ndarray): The blocks as uint64.
+        keys (ndarray): The 16 sub-keys as 48 bit integers, in encryption order.
+        sp (ndarray): The S-function and P tables, see _lookup_tables.
+        iv (uint64): The initialization vector, or the last encrypted block before these.
+
+    Returns:
+        ndarray: The encrypted blocks.
+
+    """
+    out = np.empty_like(blocks)
+    previous = iv
+    for i in range(blocks.shape[0]):
+        previous = _kernel_crypt_block(blocks[i] ^ previous, keys, sp)
+        out[i] = previous
+    return out
+
+
+@_jit
+def _kernel_decrypt_cbc(blocks, keys, sp, iv):
+    """Decrypts blocks that were encrypted using CBC mode, see __decrypt_cbc
+
+    Args:
+        blocks (ndarray): The blocks as uint64.
+        keys (ndarray): The 16 sub-keys as 48 bit integers, in decryption order.
+        sp (ndarray): The S-function and P tables, see _lookup_tables.
+        iv (uint64): The initialization vector, or the last encrypted block before these.
+
+    Returns:
+        ndarray: The decrypted blocks.
+
+    """
+    out = np.empty_like(blocks)
+    previous = iv
+    for i in range(blocks.shape[0]):
+        out[i] = _kernel_crypt_block(blocks[i], keys, sp) ^ previous
+        previous = blocks[i]
+    return out
+
+
+def __to_words(block):
+    """Converts the bytes into an array of big-endian 64 bit blocks
+
+    Args:
+        block (bytes): The bytes to convert, a multiple of 8 bytes long.
+
+    Returns:
+        ndarray: The blocks as uint64.
+
+    """
+    return np.frombuffer(block, dtype='>u8').astype(np.uint64)
+
+
+def __from_words(words):
+    """Inverse of __to_words
+
+    Args:
+        words (ndarray): The blocks as uint64.
+
+    Returns:
+        bytes: The blocks as big-endian bytes.
+
+    """
+    return words.astype('>u8').tobytes()
+
+
+def _kernel_encrypt(keys, block, mode, iv):
+    """Pads and encrypts the already validated block using the compiled kernels
+
+    Args:
+        keys (ndarray): The 16 sub-keys as 48 bit integers, in encryption order.
+        block (bytes): The input string to encrypt.
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector to use for CBC mode.
+
+    Returns:
+        bytes: The encrypted block.
+
+    """
+    sp = _lookup_tables().sp_array
+
+    def encrypt_cbc(data):
+        return __from_words(_kernel_encrypt_cbc(__to_words(data), keys, sp, np.uint64(int.from_bytes(iv, 'big'))))
+
+    if mode == CBC_CTS:
+        return __steal_ciphertext(encrypt_cbc, block)
+
+    if mode == CBC:
+        return encrypt_cbc(_pad(block))
+
+    return __from_words(_kernel_ecb(__to_words(_pad(block)), keys, sp))
+
+
+def _kernel_decrypt(keys, block, mode, iv):
+    """Decrypts and unpads the already validated block using the compiled kernels
+
+    Args:
+        keys (ndarray): The 16 sub-keys as 48 bit integers, in decryption order.
+        block (bytes): The input string to decrypt.
+        mode (str): One of CBC, CBC_CTS or ECB.
+        iv (bytes): The initialization vector used for CBC mode.
+
+    Returns:
+        bytes: The decrypted block.
+
+    """
+    sp = _lookup_tables().sp_array
+
+    def decrypt_cbc(data):
+        return __from_words(_kernel_decrypt_cbc(__to_words(data), keys, sp, np.uint64(int.from_bytes(iv, 'big'))))
+
+    def decrypt_ecb(data):
+        return __from_words(_kernel_ecb(__to_words(data), keys, sp))
+
+    if mode == CBC_CTS:
+        return __unsteal_ciphertext(decrypt_cbc, decrypt_ecb, block)
+
+    return __unpad(decrypt_cbc(block) if mode == CBC else decrypt_ecb(block))
+
+
+class JITKey:
+    """A key for the Numba compiled backend, see jit
+
+    The key schedule, rounds and mode loops all run as machine code on 64 bit integers, without
+    holding the GIL.
+
+    Args:
+        key (bytes): The key to use, MUST be exactly 8 bytes long.
+
+    """
+
+    def __init__(self, key):
+        _validate(ECB, None, key=key)
+        # Like _KS, only the first 64 bits of longer keys are used
+        self._init(_kernel_key_schedule(np.uint64(int.from_bytes(key[:8], byteorder='big'))))
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        """Creates a key from an existing key schedule
+
+        Args:
+            schedule (KeySchedule): The key schedule to use.
+
+        Returns:
+            JITKey: The key.
+
+        """
+        key = cls.__new__(cls)
+        key._init(np.array(_subkey_ints(schedule), dtype=np.uint64))
+        return key
+
+    def _init(self, keys):
+        self._keys = keys
+        self._decryption_keys = keys[::-1].copy()
+        self._sp = _lookup_tables().sp_array
+
+    def encrypt(self, block, mode=CBC, iv=None, compression=None, level=None, min_size=64):
+        """Encrypts the provided block, the result is identical to des.encrypt with the same key
+
+        Args:
+            block (bytes): The input string to encrypt.
+            mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+            iv (bytes): The initialization vector to use for CBC mode.
+            compression (str): None, ZLIB or LZMA, defaults to None (no compression).
+            level (int): The zlib compression level or lzma preset, defaults to the library default.
+            min_size (int): Blocks shorter than this are not compressed, defaults to 64.
+
+        Returns:
+            bytes: The encrypted block.
+
+        """
+        _validate(mode, iv, block=block)
+        if compression is not None:
+            block = _compress(block, compression, level, min_size)
+        return _kernel_encrypt(self._keys, block, mode, iv)
+
+    def decrypt(self, block, mode=CBC, iv=None, decompress=False, max_size=MAX_DECOMPRESSED_SIZE):
+        """Decrypts the provided block, the result is identical to des.decrypt with the same key
+
+        Args:
+            block (bytes): The input string to decrypt.
+            mode (str): One of CBC, CBC_CTS or ECB, defaults to CBC.
+            iv (bytes): The initialization vector used for CBC mode.
+            decompress (bool): Whether the block was encrypted with compression, defaults to False.
+            max_size (int): Maximum size of the decompressed block, defaults to MAX_DECOMPRESSED_SIZE.
+
+        Returns:
+            bytes: The decrypted block.
+
+        """
+        _validate(mode, iv, block=block)
+        decrypted = _kernel_decrypt(self._decryption_keys, block, mode, iv)
+        return _decompress(decrypted, max_size) if decompress else decrypted
+
+    def encrypt_block(self, block):
+        """Encrypts a single block given as an integer, without padding or chaining
+
+        The rounds run without allocating, but each call still boxes the block as np.uint64, goes
+        through the Numba dispatcher and converts the result back with int(), which is most of its
+        latency. Keeping the int in / int out signature of CompiledKey was chosen over that cost.
+
+        Args:
+            block (int): The block to encrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The encrypted block.
+
+        """
+        block = _validate_int_block(block)
+        return int(_kernel_crypt_block(np.uint64(block), self._keys, self._sp))
+
+    def decrypt_block(self, block):
+        """Decrypts a single block given as an integer, see encrypt_block
+
+        Args:
+            block (int): The block to decrypt, 0 <= block < 2 ** 64.
+
+        Returns:
+            int: The decrypted block.
+
+        """
+        block = _validate_int_block(block)
+        return int(_kernel_crypt_block(np.uint64(block), self._decryption_keys, self._sp))
+
+
+def jit(key):
+    """Returns a key that encrypts and decrypts using machine code compiled by Numba
+
+    Numba is an optional dependency. Without it, this falls back to compile(key), which has the
+    same encrypt and decrypt methods and gives identical results.
+
+    Example:
+        fast = des.jit(b'descrypt')
+        cipher_text = fast.encrypt(b'abcdefgh' * 1024, iv=b'+\x8c\x17\xcf-\xe0k>')
+
+    Args:
+        key (bytes): The key to use, MUST be exactly 8 bytes long.
+
+    Returns:
+        JITKey: The key, or a CompiledKey if Numba is not installed.
+
+    """
+    return JITKey(key) if HAS_NUMBA else compile(key)
@@ -1,12 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
 import base64
+import hashlib
+import io
+import itertools
+import os
+import subprocess
+import sys
 import numpy as np
 import des
 
 STR = b'linuslag'
 KEY = b'descrypt'
 IV = b'5J\x01C\x8c\xa6\xe3\xde'  # Random bytes from /dev/urandom, any 8 bytes would suffice
+SECRET = b'shared key store test secret'
 
 
 class TestDes(TestCase):
@@ -257,3 +265,471 @@ class TestDes(TestCase):
         actual = des.decrypt(des.encrypt(LOCAL_STR, KEY, iv=IV), KEY, iv=IV)
 
         self.assertEqual(expected, actual)
+
+
+class _ShortReads(io.RawIOBase):
+    """Raw file object that returns at most 5 bytes per read, like a pipe or unbuffered file"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self._data.seek(offset, whence)
+
+    def readinto(self, b):
+        data = self._data.read(min(len(b), 5))
+        b[:len(data)] = data
+        return len(data)
+
+
+class _ShortWrites(io.RawIOBase):
+    """Raw file object that writes at most 5 bytes per call, like a pipe or unbuffered file"""
+
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.data.write(bytes(b[:5]))
+
+
+class TestCBCReader(TestCase):
+    PLAINTEXT = bytes(range(45))
+
+    def setUp(self):
+        self.reader = des.CBCReader(io.BytesIO(des.encrypt(self.PLAINTEXT, KEY, iv=IV)), KEY, IV)
+
+    def test_size_excludes_padding(self):
+        self.assertEqual(len(self.PLAINTEXT), self.reader.size)
+
+    def test_read_all(self):
+        self.assertEqual(self.PLAINTEXT, self.reader.read())
+        self.assertEqual(b'', self.reader.read())
+
+    def test_pread_range(self):
+        self.assertEqual(self.PLAINTEXT[13:30], self.reader.pread(17, 13))
+        self.assertEqual(0, self.reader.tell())
+
+    def test_pread_past_end(self):
+        self.assertEqual(self.PLAINTEXT[40:], self.reader.pread(100, 40))
+        self.assertEqual(b'', self.reader.pread(10, 100))
+
+    def test_seek_and_read(self):
+        self.reader.seek(-5, 2)
+        self.assertEqual(self.PLAINTEXT[-5:-2], self.reader.read(3))
+        self.assertEqual(len(self.PLAINTEXT) - 2, self.reader.tell())
+
+    def test_small_cache(self):
+        reader = des.CBCReader(io.BytesIO(des.encrypt(self.PLAINTEXT, KEY, iv=IV)), KEY, IV, cache_blocks=2)
+        self.assertEqual(self.PLAINTEXT[3:], reader.pread(-1, 3))
+
+    def test_full_padding_block(self):
+        reader = des.CBCReader(io.BytesIO(des.encrypt(STR * 2, KEY, iv=IV)), KEY, IV)
+        self.assertEqual(STR * 2, reader.read())
+
+    def test_short_reads(self):
+        reader = des.CBCReader(_ShortReads(des.encrypt(self.PLAINTEXT, KEY, iv=IV)), KEY, IV)
+        self.assertEqual(self.PLAINTEXT[3:40], reader.pread(37, 3))
+
+    def test_truncated_ciphertext(self):
+        class Truncated(io.BytesIO):
+            def read(self, size=-1):
+                return super().read(size)[:-8]
+
+        with self.assertRaises(ValueError):
+            des.CBCReader(Truncated(des.encrypt(self.PLAINTEXT, KEY, iv=IV)), KEY, IV)
+
+
+class TestKeySchedule(TestCase):
+    def test_serialization_roundtrip(self):
+        data = des.KeySchedule.from_key(KEY).to_bytes()
+        schedule = des.KeySchedule.from_bytes(data)
+
+        self.assertEqual(des.KeySchedule.SIZE, len(data))
+        expected = [k.tolist() for k in des._KS(des._byte_array_to_bit_list(KEY))]
+        self.assertEqual(expected, schedule.encryption_keys.tolist())
+        self.assertEqual(expected[::-1], schedule.decryption_keys.tolist())
+
+    def test_truncated_schedule(self):
+        with self.assertRaises(ValueError):
+            des.KeySchedule.from_bytes(b'\0' * 10)
+
+    def test_incomplete_schedule(self):
+        with self.assertRaises(ValueError):
+            des.KeySchedule.from_bytes(b'\0' * des.KeySchedule.SIZE)
+
+    def test_cipher_from_schedule(self):
+        schedule = des.KeySchedule.from_bytes(des.KeySchedule.from_key(KEY).to_bytes())
+        cipher = des.Cipher.from_schedule(schedule, iv=IV)
+        ciphertext = cipher.encrypt(STR * 2)
+
+        self.assertEqual(des.encrypt(STR * 2, KEY, iv=IV), ciphertext)
+        self.assertEqual(STR * 2, cipher.decrypt(ciphertext))
+
+    def test_shared_store(self):
+        store = des.SharedKeyStore(prefix='des_ks_test', secret=SECRET)
+        store.put(KEY)
+        self.addCleanup(store.unlink, KEY)
+
+        self.assertIn(KEY, store)
+        cipher = des.Cipher.from_schedule(des.SharedKeyStore(prefix='des_ks_test', secret=SECRET).get(KEY), 'ECB')
+        self.assertEqual(des.encrypt(STR, KEY, 'ECB'), cipher.encrypt(STR))
+
+    def test_shared_store_is_not_copied(self):
+        store = des.SharedKeyStore(prefix='des_ks_test', secret=SECRET)
+        store.put(KEY)
+        self.addCleanup(store.unlink, KEY)
+
+        schedule = store.get(KEY)
+        self.assertFalse(schedule.encryption_keys.flags.owndata)
+        self.assertFalse(schedule.decryption_keys.flags.owndata)
+
+    def test_shared_store_other_processes(self):
+        store = des.SharedKeyStore(prefix='des_ks_test_mp', secret=SECRET)
+        self.addCleanup(lambda: KEY in store and store.unlink(KEY))
+
+        put = 'des.SharedKeyStore(prefix="des_ks_test_mp", secret={!r}).put({!r})'.format(SECRET, KEY)
+        get = 'assert des.Cipher.from_schedule(des.SharedKeyStore(prefix="des_ks_test_mp", secret={!r}).get({!r}), "ECB")' \
+              '.encrypt({!r}) == {!r}'.format(SECRET, KEY, STR, des.encrypt(STR, KEY, 'ECB'))
+
+        # Neither the process that puts the schedule nor the ones that read it may remove it on exit
+        for code in [put, get, get]:
+            subprocess.run([sys.executable, '-c', 'import des; ' + code], check=True,
+                           cwd=os.path.dirname(os.path.abspath(des.__file__)))
+            self.assertIn(KEY, store)
+
+    def test_shared_store_not_ready(self):
+        store = des.SharedKeyStore(prefix='des_ks_test_ready', secret=SECRET)
+        segment = des._open_segment(store._name(KEY), create=True, size=des.SharedKeyStore._SEGMENT_SIZE)
+        self.addCleanup(store.unlink, KEY)
+        self.addCleanup(segment.close)
+
+        with self.assertRaises(KeyError):
+            store.get(KEY)
+
+        # A segment that is never marked as ready is taken over instead of ignored
+        schedule = store.put(KEY)
+        self.assertFalse(schedule.encryption_keys.flags.owndata)
+        self.assertEqual(des.encrypt(STR, KEY, 'ECB'), des.Cipher.from_schedule(schedule, 'ECB').encrypt(STR))
+        self.assertEqual(des.encrypt(STR, KEY, 'ECB'), des.Cipher.from_schedule(store.get(KEY), 'ECB').encrypt(STR))
+
+    def test_shared_store_replaced_by_other_process(self):
+        store = des.SharedKeyStore(prefix='des_ks_test_replaced', secret=SECRET)
+        self.addCleanup(lambda: KEY in store and store.unlink(KEY))
+
+        def run(code):
+            store = 'des.SharedKeyStore(prefix="des_ks_test_replaced", secret={!r})'.format(SECRET)
+            subprocess.run([sys.executable, '-c', 'import des; store = {}; {}'.format(store, code.format(KEY))],
+                           check=True, cwd=os.path.dirname(os.path.abspath(des.__file__)))
+
+        # A writer that died before marking the segment as ready
+        run('des._open_segment(store._name({!r}), create=True, size=des.SharedKeyStore._SEGMENT_SIZE)')
+        with self.assertRaises(KeyError):
+            store.get(KEY)
+
+        run('store.unlink({0!r}); store.put({0!r})')
+        self.assertEqual(des.encrypt(STR, KEY, 'ECB'), des.Cipher.from_schedule(store.get(KEY), 'ECB').encrypt(STR))
+
+    def test_shared_store_secret(self):
+        store = des.SharedKeyStore(prefix='des_ks_test', secret=SECRET)
+        store.put(KEY)
+        self.addCleanup(store.unlink, KEY)
+
+        self.assertNotIn(KEY, des.SharedKeyStore(prefix='des_ks_test'))
+        self.assertNotIn(hashlib.sha256(KEY).hexdigest()[:16], store._name(KEY))
+
+    def test_shared_store_missing_key(self):
+        store = des.SharedKeyStore(prefix='des_ks_test', secret=SECRET)
+        self.assertNotIn(b'missing!', store)
+        with self.assertRaises(KeyError):
+            store.get(b'missing!')
+
+
+class TestCompiledKey(TestCase):
+    def test_matches_encrypt(self):
+        compiled = des.compile(KEY)
+        for block in [b'l', STR, b'linuslagl', STR * 5]:
+            self.assertEqual(des.encrypt(block, KEY, 'ECB'), compiled.encrypt(block, 'ECB'))
+            self.assertEqual(des.encrypt(block, KEY, iv=IV), compiled.encrypt(block, iv=IV))
+
+    def test_matches_decrypt(self):
+        compiled = des.compile(KEY)
+        for block in [b'l', STR, b'linuslagl', STR * 5]:
+            self.assertEqual(block, compiled.decrypt(des.encrypt(block, KEY, 'ECB'), 'ECB'))
+            self.assertEqual(block, compiled.decrypt(des.encrypt(block, KEY, iv=IV), iv=IV))
+
+    def test_compile_is_cached(self):
+        self.assertIs(des.compile(KEY), des.compile(KEY))
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = des.CompiledKeyCache(max_keys=2)
+        first = cache.get(b'key00001')
+        cache.get(b'key00002')
+        cache.get(b'key00001')
+        cache.get(b'key00003')
+
+        self.assertEqual(2, len(cache))
+        self.assertNotIn(b'key00002', cache)
+        self.assertIs(first, cache.get(b'key00001'))
+
+    def test_cache_memory_budget(self):
+        cache = des.CompiledKeyCache(max_bytes=1)
+        cache.get(b'key00001')
+        compiled = cache.get(b'key00002')
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual(compiled.nbytes, cache.nbytes)
+
+    def test_cache_threads(self):
+        cache = des.CompiledKeyCache()
+        keys = [b'key0000' + bytes([i % 3]) for i in range(24)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            compiled = list(pool.map(cache.get, keys))
+
+        self.assertEqual(3, len(cache))
+        self.assertEqual(sum(cache.get(key).nbytes for key in set(keys)), cache.nbytes)
+        self.assertEqual(3, len(set(map(id, compiled))))
+
+    def test_invalid_iv(self):
+        with self.assertRaises(ValueError):
+            des.compile(KEY).encrypt(STR, 'CBC', iv=b'\0')
+
+
+class TestCompression(TestCase):
+    PLAINTEXT = b'{"user": "linuslag", "event": "login"}\n' * 20
+
+    def test_zlib_roundtrip(self):
+        ciphertext = des.encrypt(self.PLAINTEXT, KEY, iv=IV, compression=des.ZLIB)
+
+        self.assertLess(len(ciphertext), len(self.PLAINTEXT) // 4)
+        self.assertEqual(self.PLAINTEXT, des.decrypt(ciphertext, KEY, iv=IV, decompress=True))
+
+    def test_lzma_roundtrip(self):
+        ciphertext = des.encrypt(self.PLAINTEXT, KEY, 'ECB', compression=des.LZMA, level=1)
+        self.assertEqual(self.PLAINTEXT, des.decrypt(ciphertext, KEY, 'ECB', decompress=True))
+
+    def test_below_min_size_is_stored(self):
+        ciphertext = des.encrypt(STR, KEY, 'ECB', compression=des.ZLIB)
+
+        self.assertEqual(des.encrypt(b'\0' + STR, KEY, 'ECB'), ciphertext)
+        self.assertEqual(STR, des.decrypt(ciphertext, KEY, 'ECB', decompress=True))
+
+    def test_incompressible_is_stored(self):
+        plaintext = bytes(range(256))
+        ciphertext = des.encrypt(plaintext, KEY, 'ECB', compression=des.ZLIB)
+
+        self.assertEqual(des.encrypt(b'\0' + plaintext, KEY, 'ECB'), ciphertext)
+        self.assertEqual(plaintext, des.decrypt(ciphertext, KEY, 'ECB', decompress=True))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            des.encrypt(self.PLAINTEXT, KEY, iv=IV, compression='gzip')
+
+    def test_max_size(self):
+        for compression in [des.ZLIB, des.LZMA]:
+            ciphertext = des.encrypt(self.PLAINTEXT, KEY, 'ECB', compression=compression)
+
+            self.assertEqual(self.PLAINTEXT, des.decrypt(ciphertext, KEY, 'ECB', decompress=True,
+                                                         max_size=len(self.PLAINTEXT)))
+            with self.assertRaises(ValueError):
+                des.decrypt(ciphertext, KEY, 'ECB', decompress=True, max_size=len(self.PLAINTEXT) - 1)
+
+    def test_cipher(self):
+        cipher = des.Cipher(KEY, iv=IV, compression=des.ZLIB)
+        ciphertext = cipher.encrypt(self.PLAINTEXT)
+
+        self.assertEqual(des.encrypt(self.PLAINTEXT, KEY, iv=IV, compression=des.ZLIB), ciphertext)
+        self.assertEqual(self.PLAINTEXT, cipher.decrypt(ciphertext))
+
+    def test_compiled_and_jit_keys(self):
+        expected = des.encrypt(self.PLAINTEXT, KEY, iv=IV, compression=des.LZMA)
+        for key in [des.compile(KEY), des.JITKey(KEY)]:
+            ciphertext = key.encrypt(self.PLAINTEXT, iv=IV, compression=des.LZMA)
+
+            self.assertEqual(expected, ciphertext)
+            self.assertEqual(self.PLAINTEXT, key.decrypt(ciphertext, iv=IV, decompress=True))
+
+
+class TestRekey(TestCase):
+    NEW_KEY = b'newkey!!'
+    NEW_IV = b'\x01\x02\x03\x04\x05\x06\x07\x08'
+    PLAINTEXT = b'linuslag rotates keys'
+
+    def test_rekey_cbc(self):
+        ciphertext = des.encrypt(self.PLAINTEXT, KEY, iv=IV)
+        expected = des.encrypt(self.PLAINTEXT, self.NEW_KEY, iv=self.NEW_IV)
+        actual = des.rekey(ciphertext, KEY, self.NEW_KEY, old_iv=IV, new_iv=self.NEW_IV)
+
+        self.assertEqual(expected, actual)
+
+    def test_rekey_change_mode(self):
+        ciphertext = des.encrypt(self.PLAINTEXT, KEY, iv=IV)
+        expected = des.encrypt(self.PLAINTEXT, self.NEW_KEY, 'ECB')
+        actual = des.rekey(ciphertext, KEY, self.NEW_KEY, new_mode='ECB', old_iv=IV)
+
+        self.assertEqual(expected, actual)
+
+    def test_rekey_stream(self):
+        plaintext = self.PLAINTEXT * 5
+        src = io.BytesIO(des.encrypt(plaintext, KEY, 'ECB'))
+        dst = io.BytesIO()
+        written = des.rekey_stream(src, dst, KEY, self.NEW_KEY, old_mode='ECB', new_iv=self.NEW_IV, chunk_size=20)
+
+        self.assertEqual(len(dst.getvalue()), written)
+        self.assertEqual(des.encrypt(plaintext, self.NEW_KEY, iv=self.NEW_IV), dst.getvalue())
+
+    def test_rekey_stream_short_reads(self):
+        plaintext = self.PLAINTEXT * 5
+        dst = io.BytesIO()
+        des.rekey_stream(_ShortReads(des.encrypt(plaintext, KEY, iv=IV)), dst, KEY, self.NEW_KEY,
+                         old_iv=IV, new_iv=self.NEW_IV)
+
+        self.assertEqual(des.encrypt(plaintext, self.NEW_KEY, iv=self.NEW_IV), dst.getvalue())
+
+    def test_rekey_stream_short_writes(self):
+        for mode in ['CBC', 'CBC-CTS']:
+            plaintext = self.PLAINTEXT * 5
+            dst = _ShortWrites()
+            written = des.rekey_stream(io.BytesIO(des.encrypt(plaintext, KEY, mode, IV)), dst, KEY, self.NEW_KEY,
+                                       mode, mode, IV, self.NEW_IV)
+
+            self.assertEqual(des.encrypt(plaintext, self.NEW_KEY, mode, self.NEW_IV), dst.data.getvalue())
+            self.assertEqual(len(dst.data.getvalue()), written)
+
+    def test_rekey_stream_truncated(self):
+        with self.assertRaises(ValueError):
+            des.rekey_stream(io.BytesIO(b'\0' * 12), io.BytesIO(), KEY, self.NEW_KEY, old_iv=IV, new_iv=self.NEW_IV)
+
+    def test_rekey_invalid_length(self):
+        with self.assertRaises(ValueError):
+            des.rekey(b'abc', KEY, self.NEW_KEY, old_iv=IV, new_iv=self.NEW_IV)
+
+
+class TestCiphertextStealing(TestCase):
+    def test_same_length_as_input(self):
+        for length in [8, 9, 15, 16, 24, 31]:
+            block = bytes(range(length))
+            ciphertext = des.encrypt(block, KEY, des.CBC_CTS, iv=IV)
+
+            self.assertEqual(length, len(ciphertext))
+            self.assertEqual(block, des.decrypt(ciphertext, KEY, des.CBC_CTS, iv=IV))
+
+    def test_single_block_is_cbc(self):
+        expected = des.encrypt(STR, KEY, iv=IV)[:8]
+        self.assertEqual(expected, des.encrypt(STR, KEY, des.CBC_CTS, iv=IV))
+
+    def test_full_blocks_swap_last_two(self):
+        cbc = des.encrypt(STR * 3, KEY, iv=IV)
+        expected = cbc[:8] + cbc[16:24] + cbc[8:16]
+        self.assertEqual(expected, des.encrypt(STR * 3, KEY, des.CBC_CTS, iv=IV))
+
+    def test_too_short(self):
+        with self.assertRaises(ValueError):
+            des.encrypt(b'linus', KEY, des.CBC_CTS, iv=IV)
+
+    def test_iv_not_provided(self):
+        with self.assertRaises(TypeError):
+            des.encrypt(STR, KEY, des.CBC_CTS)
+
+    def test_compiled_key(self):
+        block = b'linuslag rotates'[:13]
+        ciphertext = des.compile(KEY).encrypt(block, des.CBC_CTS, iv=IV)
+
+        self.assertEqual(des.encrypt(block, KEY, des.CBC_CTS, iv=IV), ciphertext)
+        self.assertEqual(block, des.compile(KEY).decrypt(ciphertext, des.CBC_CTS, iv=IV))
+
+    def test_rekey_stream(self):
+        modes = [(des.CBC, des.CBC_CTS), (des.CBC_CTS, des.CBC), (des.CBC_CTS, des.CBC_CTS)]
+        for plaintext, (old_mode, new_mode) in itertools.product([b'linuslag rotates keys', STR * 2], modes):
+            src = io.BytesIO(des.encrypt(plaintext, KEY, old_mode, iv=IV))
+            dst = io.BytesIO()
+            des.rekey_stream(src, dst, KEY, b'newkey!!', old_mode, new_mode, IV, IV, chunk_size=8)
+
+            self.assertEqual(des.encrypt(plaintext, b'newkey!!', new_mode, iv=IV), dst.getvalue())
+            self.assertEqual(dst.getvalue(), des.rekey(src.getvalue(), KEY, b'newkey!!', old_mode, new_mode, IV, IV))
+
+
+class TestJIT(TestCase):
+    def test_key_schedule(self):
+        expected = [int(''.join(map(str, k)), 2) for k in des._KS(des._byte_array_to_bit_list(KEY))]
+        actual = des._kernel_key_schedule(np.uint64(int.from_bytes(KEY, 'big'))).tolist()
+
+        self.assertEqual(expected, actual)
+
+    def test_matches_encrypt(self):
+        key = des.JITKey(KEY)
+        for block in [b'l', STR, b'linuslagl', STR * 5]:
+            self.assertEqual(des.encrypt(block, KEY, 'ECB'), key.encrypt(block, 'ECB'))
+            self.assertEqual(des.encrypt(block, KEY, iv=IV), key.encrypt(block, iv=IV))
+            self.assertEqual(des.encrypt(STR + block, KEY, des.CBC_CTS, iv=IV), key.encrypt(STR + block, des.CBC_CTS, iv=IV))
+
+    def test_matches_decrypt(self):
+        key = des.JITKey(KEY)
+        for block in [b'l', STR, b'linuslagl', STR * 5]:
+            self.assertEqual(block, key.decrypt(des.encrypt(block, KEY, 'ECB'), 'ECB'))
+            self.assertEqual(block, key.decrypt(des.encrypt(block, KEY, iv=IV), iv=IV))
+            self.assertEqual(STR + block, key.decrypt(des.encrypt(STR + block, KEY, des.CBC_CTS, iv=IV), des.CBC_CTS, iv=IV))
+
+    def test_long_key(self):
+        key = KEY + b'ignored!'
+        expected = des.encrypt(STR * 2, key, iv=IV)
+
+        self.assertEqual(expected, des.JITKey(key).encrypt(STR * 2, iv=IV))
+        self.assertEqual(expected, des.jit(key).encrypt(STR * 2, iv=IV))
+        self.assertEqual(expected, des.compile(key).encrypt(STR * 2, iv=IV))
+
+    def test_jit_falls_back_without_numba(self):
+        key = des.jit(KEY)
+
+        self.assertIsInstance(key, des.JITKey if des.HAS_NUMBA else des.CompiledKey)
+        self.assertEqual(des.encrypt(STR * 2, KEY, iv=IV), key.encrypt(STR * 2, iv=IV))
+
+
+class TestBlockAPI(TestCase):
+    def test_cipher_encrypt_block(self):
+        cipher = des.Cipher(KEY, 'ECB')
+        expected = int.from_bytes(des.encrypt(STR, KEY, 'ECB')[:8], 'big')
+
+        self.assertEqual(expected, cipher.encrypt_block(int.from_bytes(STR, 'big')))
+
+    def test_cipher_decrypt_block(self):
+        cipher = des.Cipher(KEY, 'ECB')
+        for block in [0, 1, int.from_bytes(STR, 'big'), 2 ** 64 - 1]:
+            self.assertEqual(block, cipher.decrypt_block(cipher.encrypt_block(block)))
+
+    def test_cipher_block_requires_ecb(self):
+        for mode in ['CBC', 'CBC-CTS']:
+            cipher = des.Cipher(KEY, mode, iv=IV)
+            self.assertRaises(ValueError, cipher.encrypt_block, 0)
+            self.assertRaises(ValueError, cipher.decrypt_block, 0)
+
+    def test_block_out_of_range(self):
+        for key in [des.CompiledKey(KEY), des.JITKey(KEY), des.Cipher(KEY, 'ECB')]:
+            for block in [-1, 2 ** 64]:
+                self.assertRaises(ValueError, key.encrypt_block, block)
+                self.assertRaises(ValueError, key.decrypt_block, block)
+
+    def test_block_not_an_integer(self):
+        for key in [des.CompiledKey(KEY), des.JITKey(KEY), des.Cipher(KEY, 'ECB')]:
+            for block in [1.5, '1', b'linuslag']:
+                self.assertRaises(TypeError, key.encrypt_block, block)
+                self.assertRaises(TypeError, key.decrypt_block, block)
+
+            self.assertEqual(key.encrypt_block(1), key.encrypt_block(np.uint64(1)))
+
+    def test_backends_agree(self):
+        block = int.from_bytes(STR, 'big')
+        schedule = des.KeySchedule.from_key(KEY)
+        expected = des.CompiledKey(KEY).encrypt_block(block)
+
+        self.assertEqual(expected, des.CompiledKey.from_schedule(schedule).encrypt_block(block))
+        self.assertEqual(expected, des.JITKey(KEY).encrypt_block(block))
+        self.assertEqual(block, des.JITKey.from_schedule(schedule).decrypt_block(expected))